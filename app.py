@@ -1,25 +1,48 @@
-from flask import Flask, flash, render_template, request, redirect, url_for
+from flask import Flask, abort, flash, render_template, request, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import func, inspect, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from collections import namedtuple
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import os
 import bleach
 
+from fragment_cache import FragmentCacheExtension
+from jobs import JobQueue
+from slugs import SlugIndex, candidate_slugs
+
 
 
 load_dotenv()
 
 app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or 'sqlite:///blog.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or 'SECRET'
 
 db = SQLAlchemy(app)
+migrate = Migrate(app, db)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login' # type: ignore
+jobs = JobQueue(app)
+
+# {% cache key, ttl %} for template fragments shared across users
+app.jinja_env.add_extension(FragmentCacheExtension)
+fragment_cache = app.jinja_env.fragment_cache # type: ignore
+
+# Follow-up work run off the request path after a post is committed.
+# Each handler is called with the post id inside an app context.
+post_saved_handlers = []
+
+# slug -> post id, warmed at startup and kept current by the write routes
+slug_index = SlugIndex()
 
 
 @login_manager.user_loader
@@ -33,6 +56,17 @@ def sanitize_input(text):
     return bleach.clean(text, tags=allowed_tags, attributes=allowed_attrs, strip=True)
 
 
+def post_saved(post_id):
+    for handler in post_saved_handlers:
+        handler(post_id)
+
+
+def post_url(id, slug):
+    if slug:
+        return url_for('view_post', slug=slug)
+    return url_for('view_post_by_id', id=id)
+
+
 #Database Models --------------------------------
 
 class User(UserMixin, db.Model):
@@ -58,33 +92,134 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    slug = db.Column(db.String(90), unique=True, index=True)
     
     comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')      
+    old_slugs = db.relationship('PostSlug', backref='post', lazy=True, cascade='all, delete-orphan')
+
+    def assign_slug(self, skip=()):
+        with db.session.no_autoflush:
+            for candidate in candidate_slugs(self.title):
+                if candidate in skip:
+                    continue
+                if candidate == self.slug:
+                    return
+                if self.slug_taken(candidate):
+                    continue
+                # Keep the old slug so its URLs keep redirecting here, and
+                # take back the candidate if this post used it before
+                self.old_slugs = [s for s in self.old_slugs if s.slug != candidate]
+                if self.slug:
+                    self.old_slugs.append(PostSlug(slug=self.slug))
+                self.slug = candidate
+                return
+
+    def slug_taken(self, slug):
+        return (Post.query.filter(Post.slug == slug, Post.id != self.id).first() is not None
+                or PostSlug.query.filter(PostSlug.slug == slug, PostSlug.post_id != self.id).first() is not None)
+
+    def permalink(self):
+        return post_url(self.id, self.slug)
     
 
+class PostSlug(db.Model):
+    # A slug a post had before it was renamed
+    __tablename__ = 'post_slugs'
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(90), unique=True, nullable=False, index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False, index=True)
+
+
 class Comment(db.Model):
     __tablename__ = 'comments'
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False, index=True)
+
+
+# Read Models ----------------------------------
+#
+# List pages only show a few fields per row, so they select plain columns
+# into tuples instead of loading ORM objects. Rows skip the session identity
+# map and change tracking. The whole list is still built in memory, since the
+# templates need its length.
+
+EXCERPT_LENGTH = 200
+
+
+class PostSummary(namedtuple('PostSummary', 'id title slug excerpt content_length created_at author_username')):
+    __slots__ = ()
+
+    def permalink(self):
+        return post_url(self.id, self.slug)
+
+
+UserSummary = namedtuple('UserSummary', 'id username email is_admin created_at post_count comment_count')
+
+
+def post_summaries_query():
+    return (select(Post.id, Post.title, Post.slug,
+                   func.substr(Post.content, 1, EXCERPT_LENGTH), func.length(Post.content),
+                   Post.created_at, User.username)
+            .join(User, Post.user_id == User.id)
+            .order_by(Post.created_at.desc()))
+
+
+def user_summaries_query():
+    post_count = select(func.count(Post.id)).where(Post.user_id == User.id).scalar_subquery()
+    comment_count = select(func.count(Comment.id)).where(Comment.user_id == User.id).scalar_subquery()
+    return (select(User.id, User.username, User.email, User.is_admin, User.created_at,
+                   post_count, comment_count)
+            .order_by(User.id))
+
+
+def read_rows(query, row_type):
+    return [row_type._make(row) for row in db.session.execute(query)]
 
 
 
 
 
 
+SLUG_ATTEMPTS = 5
+
+
+def save_post(post, **fields):
+    # assign_slug checks a slug is free before the commit, so two writers
+    # with the same title can both pick it. The loser gets an IntegrityError
+    # from the unique index and tries again with the next candidate.
+    skip = set()
+    for attempt in range(SLUG_ATTEMPTS):
+        for name, value in fields.items():
+            setattr(post, name, value)
+        post.assign_slug(skip)
+        slug = post.slug
+        db.session.add(post)
+        try:
+            db.session.commit()
+            return
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'slug' not in str(e.orig) or attempt == SLUG_ATTEMPTS - 1:
+                raise
+            skip.add(slug)
+
+
+
+
+
 # Routes ---------------------------------------
 
 
 
 @app.route('/')
 def index():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
+    posts = read_rows(post_summaries_query(), PostSummary)
     return render_template('index.html', posts=posts)
 
 @app.route('/about')
@@ -161,9 +296,10 @@ def create_post():
         title = sanitize_input(request.form['title'])
         content = sanitize_input(request.form['content'])
 
-        new_post = Post(title=title, content=content, user_id=current_user.id)
-        db.session.add(new_post)
-        db.session.commit()
+        new_post = Post(user_id=current_user.id)
+        save_post(new_post, title=title, content=content)
+        slug_index.set(new_post.slug, new_post.id)
+        jobs.enqueue(post_saved, new_post.id)
 
         flash('Post created successfully!', 'success')
         return redirect(url_for('index'))
@@ -174,9 +310,54 @@ def create_post():
 
 
 
+def post_slug_lookup(slug, *options):
+    """Steps for resolving a slug to a post, shared by the WSGI and ASGI views.
+
+    A generator that yields SELECT statements and expects the first result of
+    each sent back, so the caller can run them on a sync or an async session.
+    Returns the post, or None. A post whose current slug differs from the
+    one asked for was found by an old slug and should be redirected to.
+    """
+    post_id = slug_index.get(slug)
+    if post_id:
+        post = yield select(Post).options(*options).filter_by(id=post_id)
+        if post is not None and post.slug == slug:
+            return post
+
+    # Miss or stale entry (e.g. written by another worker process)
+    post = yield select(Post).options(*options).filter_by(slug=slug)
+    if post is not None:
+        slug_index.set(slug, post.id)
+        return post
+
+    # Slug the post had before a rename; the caller redirects
+    return (yield select(Post).options(*options).join(PostSlug).where(PostSlug.slug == slug))
+
+
+def run_lookup(steps):
+    try:
+        statement = next(steps)
+        while True:
+            statement = steps.send(db.session.scalars(statement).first())
+    except StopIteration as done:
+        return done.value
+
+
+@app.route('/post/<slug>')
+def view_post(slug):
+    post = run_lookup(post_slug_lookup(slug))
+    if post is None:
+        abort(404)
+    if post.slug != slug:
+        return redirect(post.permalink(), code=301)
+    return render_template('view_post.html', post=post)
+
+
 @app.route('/post/<int:id>')
-def view_post(id):
+def view_post_by_id(id):
     post = Post.query.get_or_404(id)
+    if post.slug:
+        return redirect(post.permalink(), code=301)
     return render_template('view_post.html', post=post)
 
 
@@ -191,13 +372,18 @@ def edit_post(id):
         return redirect(url_for('index'))
     
     if request.method == 'POST':
-        post.title  = sanitize_input(request.form['title'])
-        post.content = sanitize_input(request.form['content'])
-        post.updated_at = datetime.utcnow()
-        db.session.commit()
+        old_slug = post.slug
+        save_post(post,
+                  title=sanitize_input(request.form['title']),
+                  content=sanitize_input(request.form['content']),
+                  updated_at=datetime.utcnow())
+        if old_slug != post.slug:
+            slug_index.discard(old_slug)
+        slug_index.set(post.slug, post.id)
+        jobs.enqueue(post_saved, post.id)
 
         flash('Post updated successfully!', 'success')
-        return redirect(url_for('view_post', id=post.id))
+        return redirect(post.permalink())
     
     return render_template('edit_post.html', post=post) 
 
@@ -214,6 +400,7 @@ def delete_post(id):
     
     db.session.delete(post)
     db.session.commit()
+    slug_index.discard(post.slug)
 
     flash('Post deleted successfully!', 'success')
     return redirect(url_for('index'))
@@ -230,7 +417,7 @@ def add_comment(post_id):
     db.session.commit()
 
     flash('Comment added', 'success')
-    return redirect(url_for('view_post', id=post_id))
+    return redirect(post.permalink())
 
 
 
@@ -239,17 +426,17 @@ def add_comment(post_id):
 @login_required
 def delete_comment(id):
     comment = Comment.query.get_or_404(id)
-    post_id = comment.post_id
+    post = comment.post
 
     if comment.user_id != current_user.id and not current_user.is_admin:
         flash('You can only delete your own comments', 'error')
-        return redirect(url_for('view_post', id=post_id))
+        return redirect(post.permalink())
     
     db.session.delete(comment)
     db.session.commit()
 
     flash('Comment deleted', 'success')
-    return redirect(url_for('view_post', id=post_id))
+    return redirect(post.permalink())
 
 
 @app.route("/admin/users")
@@ -259,7 +446,7 @@ def admin_users():
         flash('Access denied', 'error')
         return redirect(url_for('index'))
     
-    users = User.query.all()
+    users = read_rows(user_summaries_query(), UserSummary)
     return render_template('admin_users.html', users=users)
 
 
@@ -285,8 +472,31 @@ def delete_user(id):
 
 
 
-with app.app_context():
+def create_schema():
+    # A new database gets the current schema and is stamped at the latest
+    # migration. Existing ones are left to `flask db upgrade`; creating
+    # tables here would make the migration that adds them fail.
+    if inspect(db.engine).has_table('users'):
+        return
     db.create_all()
+    script = ScriptDirectory(os.path.join(app.root_path, 'migrations'))
+    with db.engine.begin() as conn:
+        MigrationContext.configure(conn).stamp(script, 'head')
+
+
+def warm_slug_index():
+    slug_index.warm(db.session.query(Post.slug, Post.id).filter(Post.slug.isnot(None)))
+
+
+with app.app_context():
+    create_schema()
+    try:
+        warm_slug_index()
+    except OperationalError:
+        # Database predates the slug column. Let `flask db upgrade` import
+        # the app; everything else fails until it has been run.
+        db.session.rollback()
+        app.logger.warning('Database schema is out of date, run the migrations (see README)')
 
 
 
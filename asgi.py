@@ -0,0 +1,125 @@
+"""ASGI deployment mode.
+
+The read routes in ASYNC_VIEWS run on the event loop and query SQLite through
+aiosqlite with a connection pool, so one worker can have many of them waiting
+on the database at once. Every other request goes to the regular Flask app
+through asgiref's WSGI adapter.
+
+    uvicorn asgi:application --workers 4
+"""
+import io
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import abort, g, redirect, render_template, session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.exceptions import HTTPException
+
+from app import (app, db, login_manager, post_slug_lookup, post_summaries_query, PostSummary,
+                 User, Post, Comment)
+
+
+app.config.setdefault('ASYNC_POOL_SIZE', 5)
+app.config.setdefault('ASYNC_MAX_OVERFLOW', 10)
+
+with app.app_context():
+    engine = create_async_engine(
+        db.engine.url.set(drivername='sqlite+aiosqlite'),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=app.config['ASYNC_POOL_SIZE'],
+        max_overflow=app.config['ASYNC_MAX_OVERFLOW'],
+    )
+
+wsgi_app = WsgiToAsgi(app)
+
+# Everything view_post.html touches, loaded up front since async sessions
+# can't lazy load from inside a template.
+POST_PAGE_LOADS = (
+    selectinload(Post.author),
+    selectinload(Post.comments).selectinload(Comment.author),
+)
+
+
+async def load_current_user():
+    # Flask-Login would load the user with a blocking query on first use of
+    # current_user; load it here instead and leave it where Flask-Login looks.
+    user_id = session.get('_user_id')
+    if user_id is None:
+        return
+    async with AsyncSession(engine) as s:
+        user = await s.get(User, int(user_id))
+    g._login_user = user or login_manager.anonymous_user()
+
+
+async def index():
+    async with AsyncSession(engine) as s:
+        posts = [PostSummary._make(row) for row in await s.execute(post_summaries_query())]
+    return render_template('index.html', posts=posts)
+
+
+async def run_lookup(s, steps):
+    # Async counterpart of app.run_lookup
+    try:
+        statement = next(steps)
+        while True:
+            statement = steps.send((await s.scalars(statement)).first())
+    except StopIteration as done:
+        return done.value
+
+
+async def view_post(slug):
+    async with AsyncSession(engine) as s:
+        post = await run_lookup(s, post_slug_lookup(slug, *POST_PAGE_LOADS))
+    if post is None:
+        abort(404)
+    if post.slug != slug:
+        return redirect(post.permalink(), code=301)
+    return render_template('view_post.html', post=post)
+
+
+ASYNC_VIEWS = {
+    'index': index,
+    'view_post': view_post,
+}
+
+
+async def send_response(send, response, method):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in response.headers.items()],
+    })
+    body = b'' if method == 'HEAD' else response.get_data()
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+        return await wsgi_app(scope, receive, send)
+
+    adapter = WsgiToAsgiInstance(app)
+    adapter.scope = scope
+    environ = adapter.build_environ(scope, io.BytesIO())
+    try:
+        endpoint, view_args = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        endpoint = None
+    if endpoint not in ASYNC_VIEWS:
+        return await wsgi_app(scope, receive, send)
+
+    with app.request_context(environ):
+        # Mirrors Flask's full_dispatch_request / wsgi_app error handling
+        try:
+            try:
+                await load_current_user()
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await ASYNC_VIEWS[endpoint](**view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+
+    await send_response(send, response, scope['method'])
@@ -0,0 +1,135 @@
+"""Compare the WSGI and ASGI deployments under concurrent read traffic.
+
+Seeds a throwaway SQLite database, then for each mode starts the server with
+the same number of worker processes, fires requests at the read routes from
+--concurrency clients at once and reports throughput and latency.
+
+    python bench_concurrency.py [--workers 2] [--concurrency 32] [--requests 2000]
+
+WSGI runs under gunicorn's sync workers, ASGI under uvicorn. For a strict
+core-count comparison, pin the whole run with e.g. `taskset -c 0-1`.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    'wsgi': ['gunicorn', 'app:app', '--workers', '{workers}', '--bind', '127.0.0.1:{port}',
+             '--log-level', 'warning'],
+    'asgi': ['uvicorn', 'asgi:application', '--workers', '{workers}', '--port', '{port}',
+             '--log-level', 'warning'],
+}
+
+
+def seed_database(url, posts, comments):
+    env = dict(os.environ, DATABASE_URL=url)
+    code = ('from app import app, db, User, Post, Comment\n'
+            'import query_plans\n'
+            'with app.app_context():\n'
+            f'    query_plans.seed(db, User, Post, Comment, posts={posts}, comments={comments})\n')
+    subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, check=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.split(b' ', 2)[1]
+
+
+async def load(port, paths, concurrency, total):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, paths[i % len(paths)])
+            except OSError:
+                status = b''
+            latencies.append(time.perf_counter() - start)
+            if status != b'200':
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+def run_mode(mode, url, args, paths):
+    port = free_port()
+    cmd = [part.format(workers=args.workers, port=port) for part in SERVERS[mode]]
+    server = subprocess.Popen(cmd, cwd=HERE, env=dict(os.environ, DATABASE_URL=url))
+    try:
+        wait_for_port(port)
+        asyncio.run(load(port, paths, args.concurrency, args.concurrency * 2))  # warm up
+        elapsed, latencies, errors = asyncio.run(load(port, paths, args.concurrency, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--comments', type=int, default=2000)
+    parser.add_argument('--modes', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        seed_database(url, args.posts, args.comments)
+        paths = ['/'] + [f'/post/plan-post-{i}' for i in range(0, args.posts, max(1, args.posts // 20))]
+
+        print(f'{args.workers} workers, {args.concurrency} concurrent clients, {args.requests} requests')
+        print(f'{"mode":6} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for mode in args.modes:
+            r = run_mode(mode, url, args, paths)
+            print(f'{r["mode"]:6} {r["rps"]:9.1f} {r["p50"]:9.1f} {r["p99"]:9.1f} {r["errors"]:7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Measure peak memory of the list pages with ORM objects vs compact rows.
+
+For each row count, seeds a throwaway SQLite database with that many users,
+posts and comments. Each case then runs in a fresh process, and the script
+reports how far the peak RSS rose above the process's baseline after
+importing the app.
+
+    python bench_memory.py [--rows 10000 100000]
+
+The orm-* cases load full ORM objects, as the list routes used to, with the
+relationships the templates read loaded eagerly. The compact-* cases use the
+read models. The request-* cases are a whole request
+through the test client, including template rendering.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASES = ['orm-posts', 'compact-posts', 'request-index',
+         'orm-users', 'compact-users', 'request-admin-users']
+
+PASSWORD = 'bench-memory'
+BATCH = 5000
+
+
+def seed(rows):
+    from sqlalchemy import insert
+    from app import app, db, User, Post, Comment
+
+    with app.app_context():
+        admin = User(username='benchadmin', email='benchadmin@example.com', is_admin=True)
+        admin.set_password(PASSWORD)
+        db.session.add(admin)
+        db.session.commit()
+
+        start = datetime.utcnow() - timedelta(minutes=rows)
+        for table, make in (
+            (User, lambda i: {'username': f'benchuser{i}', 'email': f'benchuser{i}@example.com',
+                              'password_hash': admin.password_hash, 'is_admin': False}),
+            (Post, lambda i: {'title': f'Bench post {i}', 'content': 'Content ' * 60,
+                              'slug': f'bench-post-{i}', 'user_id': i % rows + 2,
+                              'created_at': start + timedelta(minutes=i)}),
+            (Comment, lambda i: {'content': f'Comment {i}', 'user_id': i % rows + 2,
+                                 'post_id': i % rows + 1}),
+        ):
+            for offset in range(0, rows, BATCH):
+                db.session.execute(insert(table), [make(i) for i in range(offset, min(offset + BATCH, rows))])
+            db.session.commit()
+
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(case):
+    from sqlalchemy.orm import joinedload, selectinload
+    from app import (app, read_rows, post_summaries_query, user_summaries_query,
+                     PostSummary, UserSummary, User, Post)
+
+    app.config['JOBS_SYNC'] = True
+    client = app.test_client()
+    if case == 'request-admin-users':
+        # Log in through the session: password hashing alone peaks at ~32MB
+        with app.app_context():
+            admin_id = User.query.filter_by(username='benchadmin').first().id
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin_id)
+            session['_fresh'] = True
+
+    with app.app_context():
+        baseline = peak_kb()
+        if case == 'orm-posts':
+            rows = Post.query.options(joinedload(Post.author)).order_by(Post.created_at.desc()).all()
+        elif case == 'compact-posts':
+            rows = read_rows(post_summaries_query(), PostSummary)
+        elif case == 'orm-users':
+            rows = User.query.options(selectinload(User.posts), selectinload(User.comments)).all()
+        elif case == 'compact-users':
+            rows = read_rows(user_summaries_query(), UserSummary)
+        elif case == 'request-index':
+            rows = client.get('/').data
+        elif case == 'request-admin-users':
+            rows = client.get('/admin/users').data
+        print(peak_kb() - baseline)
+        del rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--child', choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument('--seed', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_case(args.child)
+    if args.seed:
+        return seed(args.seed)
+
+    print(f'{"rows":>7} {"case":20} {"peak RSS increase":>18}')
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(tmp, "bench.db")}')
+            subprocess.run([sys.executable, __file__, '--seed', str(rows)], cwd=HERE, env=env, check=True)
+            for case in args.cases:
+                out = subprocess.run([sys.executable, __file__, '--child', case], cwd=HERE, env=env,
+                                     check=True, capture_output=True, text=True).stdout
+                print(f'{rows:7} {case:20} {int(out.split()[-1]) / 1024:15.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('jobs')
+dead_letter_logger = logging.getLogger('jobs.dead_letter')
+
+
+class JobQueue:
+    """In-process pool for work that can run after the response is sent.
+
+    Jobs run inside an app context. A failing job is retried with a linear
+    backoff and, once out of attempts, recorded in the dead-letter log.
+    With JOBS_SYNC set the job runs inline, which keeps tests deterministic.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self.dead_letters = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._metrics = {'enqueued': 0, 'succeeded': 0, 'retried': 0, 'failed': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_SYNC', False)
+        app.config.setdefault('JOBS_WORKERS', 2)
+        app.config.setdefault('JOBS_MAX_RETRIES', 3)
+        app.config.setdefault('JOBS_RETRY_DELAY', 0.5)
+        self.app = app
+        app.extensions['jobs'] = self
+
+    def enqueue(self, func, *args, **kwargs):
+        self._count('enqueued')
+        if self.app.config['JOBS_SYNC']:
+            self._run(func, args, kwargs)
+            return None
+        if self.executor is None:
+            with self._lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(
+                        max_workers=self.app.config['JOBS_WORKERS'],
+                        thread_name_prefix='jobs')
+        return self.executor.submit(self._run, func, args, kwargs)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['dead_letters'] = len(self.dead_letters)
+        return stats
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def _run(self, func, args, kwargs):
+        retries = self.app.config['JOBS_MAX_RETRIES']
+        delay = self.app.config['JOBS_RETRY_DELAY']
+        for attempt in range(retries + 1):
+            try:
+                with self.app.app_context():
+                    func(*args, **kwargs)
+                self._count('succeeded')
+                return
+            except Exception as e:
+                if attempt < retries:
+                    self._count('retried')
+                    logger.warning('Job %s failed (attempt %d), retrying: %s', func.__name__, attempt + 1, e)
+                    if not self.app.config['JOBS_SYNC']:
+                        time.sleep(delay * (attempt + 1))
+                    continue
+                self._count('failed')
+                self.dead_letters.append({
+                    'job': func.__name__,
+                    'args': args,
+                    'kwargs': kwargs,
+                    'error': repr(e),
+                    'failed_at': datetime.utcnow(),
+                })
+                dead_letter_logger.error('Job %s gave up after %d attempts: %r', func.__name__, attempt + 1, e)
+
+    def _count(self, key):
+        with self._lock:
+            self._metrics[key] += 1
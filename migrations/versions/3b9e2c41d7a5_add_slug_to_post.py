@@ -0,0 +1,40 @@
+"""Add slug to post
+
+Revision ID: 3b9e2c41d7a5
+Revises: 687c7caa0735
+Create Date: 2026-10-19 09:12:44.120931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from slugs import candidate_slugs
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e2c41d7a5'
+down_revision = '687c7caa0735'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('slug', sa.String(length=90), nullable=True))
+
+    # Backfill existing posts, oldest first so they keep the plain slug
+    conn = op.get_bind()
+    taken = set()
+    for post_id, title in conn.execute(sa.text('SELECT id, title FROM posts ORDER BY id')):
+        slug = next(s for s in candidate_slugs(title) if s not in taken)
+        taken.add(slug)
+        conn.execute(sa.text('UPDATE posts SET slug = :slug WHERE id = :id'), {'slug': slug, 'id': post_id})
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_posts_slug'), ['slug'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_posts_slug'))
+        batch_op.drop_column('slug')
@@ -0,0 +1,145 @@
+"""Audit the SQL behind the hot routes with EXPLAIN QUERY PLAN.
+
+Seeds a throwaway in-memory database, requests each route in HOT_ROUTES,
+captures the SELECTs it issues and fails if SQLite plans a full table scan
+for any of them.
+
+    python query_plans.py [--posts N] [--comments N] [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+
+# Plan lines like "SCAN comments" ("SCAN TABLE comments" before SQLite 3.36)
+# mean a full table scan. "SCAN posts USING INDEX ..." walks an index and is fine.
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+# (route, table) pairs whose whole purpose is to list every row
+ALLOWED_SCANS = {('admin_users', 'users')}
+
+PASSWORD = 'plan-audit'
+
+
+def seed(db, User, Post, Comment, users=20, posts=500, comments=5000):
+    admin = User(username='planadmin', email='planadmin@example.com', is_admin=True)
+    admin.set_password(PASSWORD)
+    db.session.add(admin)
+
+    # Hashing is slow, so the other users share one hash
+    others = [User(username=f'planuser{i}', email=f'planuser{i}@example.com',
+                   password_hash=admin.password_hash) for i in range(users)]
+    db.session.add_all(others)
+    db.session.flush()
+
+    start = datetime.utcnow() - timedelta(days=posts)
+    post_rows = []
+    for i in range(posts):
+        post = Post(title=f'Plan post {i}', content='Content ' * 20, user_id=admin.id,
+                    created_at=start + timedelta(days=i), slug=f'plan-post-{i}')
+        post_rows.append(post)
+    db.session.add_all(post_rows)
+    db.session.flush()
+
+    db.session.add_all(Comment(content=f'Comment {i}', user_id=others[i % len(others)].id,
+                               post_id=post_rows[i % len(post_rows)].id)
+                       for i in range(comments))
+    db.session.commit()
+    return admin, post_rows, others
+
+
+def hot_routes(posts, users):
+    """(route name, method, url, form data, log in first) for each hot path.
+
+    The deletes come last since they remove seeded rows; their cascades load
+    comments by post_id and posts/comments by user_id.
+    """
+    post = posts[len(posts) // 2]
+    return [
+        ('index', 'GET', '/', None, False),
+        ('view_post', 'GET', f'/post/{post.slug}', None, False),
+        ('view_post', 'GET', f'/post/{post.slug}', None, True),
+        ('view_post_by_id', 'GET', f'/post/{post.id}', None, False),
+        ('view_post', 'GET', '/post/renamed-or-missing', None, False),
+        ('login', 'POST', '/login', {'username': 'planadmin', 'password': PASSWORD}, False),
+        ('add_comment', 'POST', f'/post/{post.id}/comment', {'content': 'Audit'}, True),
+        ('create_post', 'POST', '/post/new', {'title': post.title, 'content': 'Audit'}, True),
+        ('edit_post', 'GET', f'/post/{post.id}/edit', None, True),
+        ('admin_users', 'GET', '/admin/users', None, True),
+        ('delete_post', 'GET', f'/post/{posts[0].id}/delete', None, True),
+        ('delete_user', 'GET', f'/admin/user/{users[0].id}/delete', None, True),
+    ]
+
+
+def capture_selects(engine, statements):
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def audit(app, db, User, Post, Comment, verbose=False, **seed_counts):
+    """Return a list of (route, table, statement) full scans found on hot routes."""
+    _, posts, users = seed(db, User, Post, Comment, **seed_counts)
+    violations = []
+
+    for route, method, url, data, login in hot_routes(posts, users):
+        client = app.test_client()
+        if login:
+            client.post('/login', data={'username': 'planadmin', 'password': PASSWORD})
+
+        statements = []
+        stop = capture_selects(db.engine, statements)
+        try:
+            client.open(url, method=method, data=data)
+        finally:
+            stop()
+
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                for row in plan:
+                    detail = row[-1]
+                    if verbose:
+                        print(f'{route:16} {detail}')
+                    match = FULL_SCAN.match(detail)
+                    if match and (route, match.group(1)) not in ALLOWED_SCANS:
+                        violation = (route, match.group(1), ' '.join(statement.split()))
+                        if violation not in violations:
+                            violations.append(violation)
+
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--verbose', action='store_true', help='print every plan line')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+    from app import app, db, User, Post, Comment
+
+    app.config['JOBS_SYNC'] = True
+    with app.app_context():
+        db.create_all()
+        violations = audit(app, db, User, Post, Comment, verbose=args.verbose,
+                           posts=args.posts, comments=args.comments)
+
+    for route, table, statement in violations:
+        print(f'FULL SCAN of {table} in {route}: {statement}')
+    if violations:
+        return 1
+    print('No full table scans on hot routes.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import html
+import re
+import threading
+import unicodedata
+
+
+# Paths under /post/ that belong to other routes and can't be used as slugs.
+RESERVED_SLUGS = {'new'}
+MAX_SLUG_LENGTH = 80
+
+
+def slugify(title):
+    """Turn a (sanitized, possibly HTML) post title into a URL slug."""
+    text = html.unescape(re.sub(r'<[^>]*>', '', title or ''))
+    # Split accented letters into base letter + combining mark, then drop the marks
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).lower()
+    slug = re.sub(r'[^a-z0-9]+', '-', text).strip('-')[:MAX_SLUG_LENGTH].rstrip('-')
+    if not slug:
+        return 'post'
+    # An all-digit slug would be routed to the numeric /post/<int:id> URL
+    if slug.isdigit() or slug in RESERVED_SLUGS:
+        slug = f'post-{slug}'
+    return slug
+
+
+def candidate_slugs(title):
+    """Yield the slug for a title followed by -2, -3, ... fallbacks."""
+    base = slugify(title)
+    yield base
+    n = 2
+    while True:
+        yield f'{base}-{n}'
+        n += 1
+
+
+class SlugIndex:
+    """Process-local slug -> post id map so permalinks resolve without a query."""
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def warm(self, pairs):
+        ids = {slug: post_id for slug, post_id in pairs if slug}
+        with self._lock:
+            self._ids = ids
+
+    def get(self, slug):
+        return self._ids.get(slug)
+
+    def set(self, slug, post_id):
+        with self._lock:
+            self._ids[slug] = post_id
+
+    def discard(self, slug):
+        with self._lock:
+            self._ids.pop(slug, None)
+
+    def __len__(self):
+        return len(self._ids)
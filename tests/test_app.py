@@ -1,5 +1,22 @@
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+# The engine is created when app is imported, so point it at a throwaway
+# database before then rather than in create_app. It's a file rather than
+# :memory: so the ASGI tests' aiosqlite engine sees the same data.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
 from flask_testing import TestCase
-from app import app, db, User, Post, Comment
+from app import (app, db, jobs, fragment_cache, post_saved_handlers, slug_index, read_rows,
+                 post_summaries_query, user_summaries_query, PostSummary, UserSummary, User, Post, Comment)
+from asgiref.testing import ApplicationCommunicator
+from fragment_cache import LRUCache
+import asgi
+import query_plans
 
 
 
@@ -13,10 +30,13 @@ class BaseTestCase(TestCase):
         app.config['TESTING'] = True
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         app.config['WTF_CSRF_ENABLED'] = False
+        app.config['JOBS_SYNC'] = True
         return app
     
     def setUp(self):
         db.create_all()
+        slug_index.warm([])
+        fragment_cache.clear()
         # Create test admin user
         self.admin = User(username='adminuser', email='admin@example.com', is_admin=True)
         self.admin.set_password('admin123')
@@ -329,6 +349,486 @@ class DatabaseTestCase(BaseTestCase):
         deleted_comment = Comment.query.get(comment_id)
         self.assertIsNone(deleted_comment)
 
+    def test_hot_routes_avoid_full_table_scans(self):
+        """Test hot route queries are served from indexes"""
+        violations = query_plans.audit(app, db, User, Post, Comment, posts=20, comments=100)
+        self.assertEqual(violations, [])
+
+    def test_full_scan_detection_handles_old_sqlite_format(self):
+        """Test both SQLite plan formats are recognised as full scans"""
+        self.assertEqual(query_plans.FULL_SCAN.match('SCAN comments').group(1), 'comments')
+        self.assertEqual(query_plans.FULL_SCAN.match('SCAN TABLE comments').group(1), 'comments')
+        self.assertIsNone(query_plans.FULL_SCAN.match('SCAN posts USING INDEX ix_posts_created_at'))
+        self.assertIsNone(query_plans.FULL_SCAN.match('SCAN TABLE posts USING INDEX ix_posts_created_at'))
+
+
+
+# ===== Read Model Tests =====
+
+class ReadModelTestCase(BaseTestCase):
+    """Test compact rows used by list pages"""
+
+    def test_post_summaries_are_plain_rows(self):
+        """Test post summaries carry the excerpt and skip the identity map"""
+        post = Post(title='Long', content='x' * 250, user_id=self.admin.id)
+        db.session.add(post)
+        db.session.commit()
+        db.session.expunge_all()
+
+        rows = read_rows(post_summaries_query(), PostSummary)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].excerpt, 'x' * 200)
+        self.assertEqual(rows[0].content_length, 250)
+        self.assertEqual(rows[0].author_username, 'adminuser')
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_index_lists_post_excerpts(self):
+        """Test home page renders summaries newest first"""
+        db.session.add_all([
+            Post(title='Older', content='Short', user_id=self.admin.id, created_at=datetime(2024, 1, 1)),
+            Post(title='Newer', content='y' * 250, user_id=self.admin.id, created_at=datetime(2024, 2, 1)),
+        ])
+        db.session.commit()
+
+        response = self.client.get('/')
+        self.assert200(response)
+        self.assertLess(response.data.index(b'Newer'), response.data.index(b'Older'))
+        self.assertIn(b'y' * 200 + b'...', response.data)
+        self.assertIn(b'Short</p>', response.data)
+
+    def test_user_summaries_count_posts_and_comments(self):
+        """Test user summaries include post and comment counts"""
+        post = Post(title='Test', content='Content', user_id=self.admin.id)
+        db.session.add(post)
+        db.session.commit()
+        db.session.add_all([
+            Comment(content='One', user_id=self.user.id, post_id=post.id),
+            Comment(content='Two', user_id=self.user.id, post_id=post.id),
+        ])
+        db.session.commit()
+
+        rows = {row.username: row for row in read_rows(user_summaries_query(), UserSummary)}
+        self.assertEqual((rows['adminuser'].post_count, rows['adminuser'].comment_count), (1, 0))
+        self.assertEqual((rows['testuser'].post_count, rows['testuser'].comment_count), (0, 2))
+
+    def test_admin_users_page(self):
+        """Test user management page lists every user"""
+        self.client.post('/login', data={'username': 'adminuser', 'password': 'admin123'})
+        response = self.client.get('/admin/users')
+        self.assert200(response)
+        self.assertIn(b'Total Users: 2', response.data)
+        self.assertIn(b'test@example.com', response.data)
+
+
+# ===== Slug Tests =====
+
+class SlugTestCase(BaseTestCase):
+    """Test slug permalinks for posts"""
+
+    def login_admin(self):
+        """Helper to login admin user"""
+        self.client.post('/login', data={
+            'username': 'adminuser',
+            'password': 'admin123'
+        })
+
+    def create_post(self, title):
+        """Helper to create a post through the route"""
+        self.client.post('/post/new', data={'title': title, 'content': 'Content'})
+        return Post.query.filter_by(title=title).order_by(Post.id.desc()).first()
+
+    def test_create_post_generates_slug(self):
+        """Test creating a post assigns a slug and indexes it"""
+        self.login_admin()
+        post = self.create_post('Hello, <strong>World</strong>!')
+
+        self.assertEqual(post.slug, 'hello-world')
+        self.assertEqual(slug_index.get('hello-world'), post.id)
+
+    def test_accented_title_is_transliterated(self):
+        """Test accented letters keep their base letter in the slug"""
+        self.login_admin()
+        self.assertEqual(self.create_post('Café résumé').slug, 'cafe-resume')
+
+    def test_duplicate_title_gets_suffix(self):
+        """Test slug collisions are resolved with a numeric suffix"""
+        self.login_admin()
+        first = self.create_post('Same Title')
+        second = self.create_post('Same Title')
+
+        self.assertEqual(first.slug, 'same-title')
+        self.assertEqual(second.slug, 'same-title-2')
+
+    def test_concurrent_slug_collision_is_retried(self):
+        """Test a slug taken between the check and the commit is retried"""
+        self.login_admin()
+        first = self.create_post('Race')
+
+        # Simulate the other writer committing after our check ran
+        with patch.object(Post, 'slug_taken', return_value=False):
+            second = self.create_post('Race')
+            self.client.post(f'/post/{first.id}/edit', data={'title': 'Race', 'content': 'Edited'})
+
+        self.assertEqual(first.slug, 'race')
+        self.assertEqual(second.slug, 'race-2')
+        self.assertEqual(Post.query.get(first.id).content, 'Edited')
+
+    def test_rename_collision_is_retried(self):
+        """Test an edit whose new slug was just taken keeps its changes"""
+        self.login_admin()
+        self.create_post('Taken')
+        post = self.create_post('Other')
+
+        with patch.object(Post, 'slug_taken', return_value=False):
+            response = self.client.post(f'/post/{post.id}/edit', data={'title': 'Taken', 'content': 'New'})
+
+        self.assertEqual(response.status_code, 302)
+        post = Post.query.get(post.id)
+        self.assertEqual((post.title, post.slug, post.content), ('Taken', 'taken-2', 'New'))
+
+    def test_reserved_and_numeric_titles(self):
+        """Test slugs never shadow other /post/ routes"""
+        self.login_admin()
+        self.assertEqual(self.create_post('New').slug, 'post-new')
+        self.assertEqual(self.create_post('2024').slug, 'post-2024')
+
+    def test_view_post_by_slug(self):
+        """Test post is served at its slug URL"""
+        self.login_admin()
+        post = self.create_post('Slug Post')
+
+        response = self.client.get('/post/slug-post')
+        self.assert200(response)
+        self.assertIn(b'Slug Post', response.data)
+
+    def test_view_post_by_slug_without_warm_index(self):
+        """Test a slug missing from the index falls back to the database"""
+        self.login_admin()
+        post = self.create_post('Cold Post')
+        slug_index.warm([])
+
+        self.assert200(self.client.get('/post/cold-post'))
+        self.assertEqual(slug_index.get('cold-post'), post.id)
+
+    def test_numeric_url_redirects_to_slug(self):
+        """Test old numeric URLs redirect permanently"""
+        self.login_admin()
+        post = self.create_post('Old Link')
+
+        response = self.client.get(f'/post/{post.id}')
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response.location.endswith('/post/old-link'))
+
+    def test_edit_post_updates_slug(self):
+        """Test renaming a post moves its slug"""
+        self.login_admin()
+        post = self.create_post('Before')
+
+        self.client.post(f'/post/{post.id}/edit', data={'title': 'After', 'content': 'Content'})
+        self.assertEqual(Post.query.get(post.id).slug, 'after')
+        self.assertIsNone(slug_index.get('before'))
+
+    def test_old_slug_redirects_after_rename(self):
+        """Test old slug and numeric URLs still reach a renamed post"""
+        self.login_admin()
+        post = self.create_post('Before')
+        self.client.post(f'/post/{post.id}/edit', data={'title': 'After', 'content': 'Content'})
+
+        response = self.client.get('/post/before')
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response.location.endswith('/post/after'))
+        self.assertTrue(self.client.get(f'/post/{post.id}').location.endswith('/post/after'))
+        self.assert200(self.client.get('/post/before', follow_redirects=True))
+
+    def test_old_slug_is_not_reused_by_other_posts(self):
+        """Test a renamed post keeps its old slug reserved, and can take it back"""
+        self.login_admin()
+        post = self.create_post('Before')
+        self.client.post(f'/post/{post.id}/edit', data={'title': 'After', 'content': 'Content'})
+
+        self.assertEqual(self.create_post('Before').slug, 'before-2')
+
+        self.client.post(f'/post/{post.id}/edit', data={'title': 'Before', 'content': 'Content'})
+        self.assertEqual(Post.query.get(post.id).slug, 'before')
+        self.assertTrue(self.client.get('/post/after').location.endswith('/post/before'))
+
+
+# ===== Fragment Cache Tests =====
+
+class FragmentCacheTestCase(BaseTestCase):
+    """Test template fragment caching"""
+
+    def login_admin(self):
+        """Helper to login admin user"""
+        self.client.post('/login', data={
+            'username': 'adminuser',
+            'password': 'admin123'
+        })
+
+    def test_cache_tag_reuses_rendered_fragment(self):
+        """Test a fragment is rendered once per key"""
+        template = app.jinja_env.from_string('{% cache key, 60 %}{{ value }}{% endcache %}')
+
+        self.assertEqual(template.render(key='k', value='first'), 'first')
+        self.assertEqual(template.render(key='k', value='second'), 'first')
+        self.assertEqual(template.render(key='other', value='second'), 'second')
+
+    def test_lru_evicts_by_entries_and_size(self):
+        """Test least recently used entries are evicted when over either bound"""
+        cache = LRUCache(max_entries=2, max_size=10)
+        cache.set('a', 'aaa')
+        cache.set('b', 'bbb')
+        cache.get('a')
+        cache.set('c', 'ccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'aaa')
+
+        cache.set('d', 'dddddddd')
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.size, 10)
+
+    def test_lru_expires_entries(self):
+        """Test entries past their ttl are not returned"""
+        cache = LRUCache()
+        cache.set('a', 'aaa', ttl=10)
+        cache.set('b', 'bbb')
+        with patch('fragment_cache.time.monotonic', return_value=time.monotonic() + 11):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), 'bbb')
+        self.assertEqual(len(cache), 1)
+
+    def test_zero_ttl_is_not_cached(self):
+        """Test a ttl of 0 renders the block every time"""
+        cache = LRUCache()
+        cache.set('a', 'aaa', ttl=0)
+        self.assertIsNone(cache.get('a'))
+
+        template = app.jinja_env.from_string('{% cache key, 0 %}{{ value }}{% endcache %}')
+        self.assertEqual(template.render(key='zero', value='first'), 'first')
+        self.assertEqual(template.render(key='zero', value='second'), 'second')
+
+    def test_edited_post_is_not_served_stale(self):
+        """Test the post fragment changes once the post is updated"""
+        self.login_admin()
+        self.client.post('/post/new', data={'title': 'Cached', 'content': 'Old body'})
+        post = Post.query.filter_by(title='Cached').first()
+        self.assertIn(b'Old body', self.client.get(f'/post/{post.slug}').data)
+
+        self.client.post(f'/post/{post.id}/edit', data={'title': 'Cached', 'content': 'New body'})
+        response = self.client.get(f'/post/{post.slug}')
+        self.assertIn(b'New body', response.data)
+        self.assertNotIn(b'Old body', response.data)
+
+    def test_user_controls_render_around_cached_fragments(self):
+        """Test per-user buttons are not cached with the fragment"""
+        post = Post(title='Shared', content='Content', user_id=self.admin.id)
+        db.session.add(post)
+        db.session.commit()
+
+        anonymous = self.client.get(f'/post/{post.id}')
+        self.assertNotIn(b'btn-edit', anonymous.data)
+
+        hits = fragment_cache.hits
+        self.login_admin()
+        admin = self.client.get(f'/post/{post.id}')
+        self.assertIn(b'btn-edit', admin.data)
+        self.assertGreater(fragment_cache.hits, hits)
+
+
+# ===== ASGI Tests =====
+
+class AsgiTestCase(BaseTestCase):
+    """Test the ASGI entry point"""
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post(title='Async Post', content='Async content', user_id=self.admin.id, slug='async-post')
+        db.session.add(self.post)
+        db.session.commit()
+
+    def request(self, path, method='GET', cookie=None):
+        """Helper to send one request through asgi.application"""
+        headers = [(b'host', b'localhost')]
+        if cookie:
+            headers.append((b'cookie', f'session={cookie}'.encode()))
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': headers, 'server': ('localhost', 80),
+        }
+
+        async def run():
+            communicator = ApplicationCommunicator(asgi.application, scope)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    break
+            # Pooled connections belong to this event loop
+            await asgi.engine.dispose()
+            return start['status'], body
+
+        return asyncio.run(run())
+
+    def test_index(self):
+        """Test home page is served by the async view"""
+        status, body = self.request('/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Async Post', body)
+
+    def test_view_post(self):
+        """Test post page is served at its slug"""
+        status, body = self.request('/post/async-post')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Async content', body)
+        self.assertNotIn(b'btn-edit', body)
+
+    def test_old_slug_redirects(self):
+        """Test a slug from before a rename redirects to the current one"""
+        self.post.title = 'Renamed'
+        self.post.assign_slug()
+        db.session.commit()
+
+        status, _ = self.request('/post/async-post')
+        self.assertEqual(status, 301)
+
+    def test_missing_post(self):
+        """Test unknown slug returns 404"""
+        status, _ = self.request('/post/missing')
+        self.assertEqual(status, 404)
+
+    def test_admin_sees_edit_controls(self):
+        """Test the session user is loaded for async views"""
+        self.client.post('/login', data={'username': 'adminuser', 'password': 'admin123'})
+        cookie = self.client.get_cookie('session').value
+
+        status, body = self.request('/post/async-post', cookie=cookie)
+        self.assertEqual(status, 200)
+        self.assertIn(b'btn-edit', body)
+
+    def test_head_request(self):
+        """Test HEAD returns headers without a body"""
+        status, body = self.request('/post/async-post', method='HEAD')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'')
+
+    def test_other_routes_fall_back_to_wsgi(self):
+        """Test routes without an async view go through the Flask app"""
+        status, body = self.request('/about')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.client.get('/about').data)
+
+        status, _ = self.request(f'/post/{self.post.id}')
+        self.assertEqual(status, 301)
+
+    def test_unexpected_error_uses_flask_error_handling(self):
+        """Test errors in async views become Flask 500 responses"""
+        async def broken():
+            raise RuntimeError('boom')
+
+        original = asgi.ASYNC_VIEWS['index']
+        asgi.ASYNC_VIEWS['index'] = broken
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+        try:
+            with self.assertLogs(app.logger, 'ERROR'):
+                status, _ = self.request('/')
+        finally:
+            asgi.ASYNC_VIEWS['index'] = original
+            app.config['PROPAGATE_EXCEPTIONS'] = None
+        self.assertEqual(status, 500)
+
+
+# ===== Background Job Tests =====
+
+class JobQueueTestCase(BaseTestCase):
+    """Test post-write jobs and the job queue"""
+
+    def setUp(self):
+        super().setUp()
+        self.saved = []
+        post_saved_handlers.append(self.saved.append)
+
+    def tearDown(self):
+        post_saved_handlers.remove(self.saved.append)
+        super().tearDown()
+
+    def login_admin(self):
+        """Helper to login admin user"""
+        self.client.post('/login', data={
+            'username': 'adminuser',
+            'password': 'admin123'
+        })
+
+    def test_create_post_runs_post_saved_handlers(self):
+        """Test creating a post enqueues post-save work"""
+        self.login_admin()
+        self.client.post('/post/new', data={
+            'title': 'Queued',
+            'content': 'Content'
+        })
+
+        post = Post.query.filter_by(title='Queued').first()
+        self.assertEqual(self.saved, [post.id])
+
+    def test_edit_post_runs_post_saved_handlers(self):
+        """Test editing a post enqueues post-save work"""
+        self.login_admin()
+        post = Post(title='Original', content='Content', user_id=self.admin.id)
+        db.session.add(post)
+        db.session.commit()
+
+        self.client.post(f'/post/{post.id}/edit', data={
+            'title': 'Edited',
+            'content': 'Content'
+        })
+        self.assertEqual(self.saved, [post.id])
+
+    def test_failing_job_is_retried_then_dead_lettered(self):
+        """Test a job that keeps failing ends up in the dead-letter log"""
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise RuntimeError('boom')
+
+        before = jobs.metrics()
+        jobs.enqueue(broken)
+        after = jobs.metrics()
+
+        self.assertEqual(len(calls), app.config['JOBS_MAX_RETRIES'] + 1)
+        self.assertEqual(after['failed'] - before['failed'], 1)
+        self.assertEqual(jobs.dead_letters[-1]['job'], 'broken')
+
+    def test_thread_pool_retries_then_succeeds(self):
+        """Test jobs run on the worker pool and are retried after a failure"""
+        app.config['JOBS_SYNC'] = False
+        app.config['JOBS_RETRY_DELAY'] = 0.01
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('first attempt fails')
+
+        try:
+            before = jobs.metrics()
+            future = jobs.enqueue(flaky)
+            self.assertIsNotNone(future)
+            future.result(timeout=5)
+            after = jobs.metrics()
+        finally:
+            jobs.shutdown()
+            app.config['JOBS_SYNC'] = True
+            app.config['JOBS_RETRY_DELAY'] = 0.5
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(after['retried'] - before['retried'], 1)
+        self.assertEqual(after['succeeded'] - before['succeeded'], 1)
+        self.assertEqual(after['failed'] - before['failed'], 0)
+
 
 if __name__ == '__main__':
     import unittest